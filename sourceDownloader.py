@@ -10,296 +10,629 @@ Respects server trust boundaries.
 
 import os
 import sys
+import re
+import codecs
 import argparse
 import hashlib
+import functools
+import socket
+import secrets
 import threading
 from collections import deque
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urljoin, urlparse, unquote
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
+from types import MappingProxyType
+from typing import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from urllib.parse import ParseResult, urljoin, urlparse, unquote
 
-from bs4 import BeautifulSoup, FeatureNotFound
+import urllib3
+from urllib3.exceptions import HTTPError
+import lxml.html
+from lxml import etree
 
 
 USER_AGENT = "Mozilla/5.0 (Educational Website Crawler)"
 TIMEOUT = 10
-visited_lock = threading.Lock()
+ASSET_WORKERS = 32
+CHUNK_SIZE = 64 * 1024
+PER_HOST_CONNECTIONS = 8
+RETRY_AFTER_MAX = TIMEOUT
+visited: set[str] = set()
+
+# One keep-alive pool for the whole crawl, so pages and assets on the same
+# host reuse their TCP/TLS connections instead of reconnecting every time.
+# block=True caps each host at PER_HOST_CONNECTIONS in-flight requests;
+# extra page/asset workers wait for a free connection rather than opening
+# more and getting throttled.
+_POOL = urllib3.PoolManager(
+    num_pools=16,
+    maxsize=PER_HOST_CONNECTIONS,
+    block=True,
+    headers={"User-Agent": USER_AGENT},
+)
+
+
+class _Retry(urllib3.Retry):
+    # Cap Retry-After waits so a throttling server can't park a worker for
+    # hours (urllib3's own retry_after_max only exists from 2.7 on).
+    def parse_retry_after(self, retry_after: str) -> float:
+        return min(super().parse_retry_after(retry_after), RETRY_AFTER_MAX)
+
+
+_RETRIES = _Retry(
+    connect=2,
+    read=2,
+    redirect=10,
+    status=3,
+    status_forcelist=(429, 503),
+    backoff_factor=0.5,
+    respect_retry_after_header=True,
+)
 
 
 # -----------------------------
 # Networking helpers
 # -----------------------------
 
-def safe_request(url: str):
-    req = Request(url, headers={"User-Agent": USER_AGENT})
-    return urlopen(req, timeout=TIMEOUT)
+def safe_request(url: str) -> urllib3.BaseHTTPResponse:
+    response = _POOL.request(
+        "GET",
+        url,
+        timeout=TIMEOUT,
+        preload_content=False,
+        retries=_RETRIES,
+    )
+    if response.status >= 400:
+        response.drain_conn()
+        response.release_conn()
+        raise HTTPError(f"HTTP Error {response.status}: {response.reason}")
+    return response
+
+
+_system_getaddrinfo = socket.getaddrinfo
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_getaddrinfo(*args, **kwargs):
+    return _system_getaddrinfo(*args, **kwargs)
+
+
+def enable_dns_cache():
+    # urllib3 resolves through socket.getaddrinfo for every new connection;
+    # a crawl only ever talks to a handful of hosts, so resolve each once.
+    socket.getaddrinfo = _cached_getaddrinfo
+
+
+@functools.lru_cache(maxsize=8192)
+def _parse(url: str) -> ParseResult:
+    # The same page and asset URLs are parsed over and over while
+    # extracting, rewriting and naming files; parse each one once.
+    return urlparse(url)
 
 
 def is_same_origin(base: str, target: str) -> bool:
-    return urlparse(base).netloc == urlparse(target).netloc
+    return _parse(base).netloc == _parse(target).netloc
+
+
+_NETLOC_RE = re.compile(r"https?://([^/?#]*)", re.IGNORECASE)
+
+
+def _netloc(url: str) -> str:
+    # urlparse(url).netloc for the absolute http(s) URLs urljoin produces,
+    # without building a ParseResult; anything else has no origin to match.
+    match = _NETLOC_RE.match(url)
+    return match.group(1) if match else ""
 
 
 # -----------------------------
 # File helpers
 # -----------------------------
 
+_CONTENT_TYPE_EXTENSIONS = MappingProxyType({
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/svg+xml": ".svg",
+    "image/bmp": ".bmp",
+    "image/x-icon": ".ico",
+    "application/pdf": ".pdf",
+    "text/css": ".css",
+    "application/javascript": ".js",
+    "text/javascript": ".js",
+})
+
+
+@functools.lru_cache(maxsize=256)
 def _guess_extension(content_type: str | None) -> str | None:
     if not content_type:
         return None
 
     content_type = content_type.split(";", 1)[0].strip().lower()
-    mapping = {
-        "image/jpeg": ".jpg",
-        "image/jpg": ".jpg",
-        "image/png": ".png",
-        "image/webp": ".webp",
-        "image/gif": ".gif",
-        "image/svg+xml": ".svg",
-        "image/bmp": ".bmp",
-        "image/x-icon": ".ico",
-        "application/pdf": ".pdf",
-        "text/css": ".css",
-        "application/javascript": ".js",
-        "text/javascript": ".js",
-    }
-    return mapping.get(content_type)
-
-
-def _append_query_suffix(path: str, query: str) -> str:
+    return _CONTENT_TYPE_EXTENSIONS.get(content_type)
+
+
+def _query_suffix(query: str) -> str:
     if not query:
-        return path
+        return ""
 
-    stem, ext = os.path.splitext(path)
-    suffix = hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]
-    return f"{stem}__{suffix}{ext}"
+    suffix = hashlib.blake2b(query.encode("utf-8"), digest_size=6).hexdigest()
+    return f"__{suffix}"
 
 
-def sanitize_path(url: str, base_dir: str, content_type: str | None = None) -> str:
-    parsed = urlparse(url)
+@functools.lru_cache(maxsize=8192)
+def _url_shape(url: str) -> tuple[str, str, str]:
+    # Everything about the local path that depends on the URL alone:
+    # (stem, extension from the URL or "", query hash suffix or "").
+    parsed = _parse(url)
     path = unquote(parsed.path).lstrip("/")
 
     if not path or path.endswith("/"):
         path = os.path.join(path, "index")
 
-    ext = os.path.splitext(path)[1]
+    stem, ext = os.path.splitext(path)
+    return stem, ext, _query_suffix(parsed.query)
+
+
+_created_dirs: set[str] = set()
+_created_dirs_lock = threading.Lock()
+
+
+def _ensure_dir(path: str):
+    directory = os.path.dirname(path)
+    if directory in _created_dirs:
+        return
+
+    with _created_dirs_lock:
+        if directory not in _created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            _created_dirs.add(directory)
+
+
+def sanitize_path(url: str, base_dir: str, content_type: str | None = None) -> str:
+    stem, ext, suffix = _url_shape(url)
     if not ext:
-        guessed = _guess_extension(content_type)
-        if guessed:
-            path = f"{path}{guessed}"
-        else:
-            path = f"{path}.html"
+        ext = _guess_extension(content_type) or ".html"
 
-    path = _append_query_suffix(path, parsed.query)
+    return os.path.join(base_dir, f"{stem}{suffix}{ext}")
 
-    return os.path.join(base_dir, path)
 
+# Local path of every asset already saved during this crawl, keyed by
+# (url, base_dir), so an asset shared by many pages is downloaded once and
+# later pages reuse the saved file, but never a copy under another tree.
+saved_files: dict[tuple[str, str], str] = {}
 
-def save_file(url: str, base_dir: str) -> str | None:
+# BLAKE2b digest -> first local path saved with that content. Identical
+# files under different URLs (CDN mirrors, cache-busting query strings)
+# are hard-linked to the first copy instead of taking up disk again.
+# Pages are never linked: each copy is rewritten relative to its own
+# directory, so identical source HTML does not stay identical on disk.
+_saved_digests: dict[str, str] = {}
+_path_digests: dict[str, str] = {}
+_saved_digests_lock = threading.Lock()
+
+_HTML_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+_XML_TYPES = frozenset({"application/xml", "text/xml"})
+_PAGE_EXTENSIONS = (".html", ".htm", ".xhtml", ".xml")
+_XML_PAGE_EXTENSIONS = (".xhtml", ".xht", ".xml")
+
+
+def _media_type(content_type: str) -> str:
+    return content_type.split(";", 1)[0].strip().lower()
+
+
+def _is_page(local_path: str, content_type: str) -> bool:
+    media_type = _media_type(content_type)
+    return (
+        media_type in _HTML_TYPES
+        or media_type in _XML_TYPES
+        or local_path.lower().endswith(_PAGE_EXTENSIONS)
+    )
+
+
+def _forget_digest(local_path: str):
+    # The file at local_path was just replaced, so it no longer holds the
+    # content it was recorded with; don't link future duplicates to it.
+    with _saved_digests_lock:
+        digest = _path_digests.pop(local_path, None)
+        if digest is not None and _saved_digests.get(digest) == local_path:
+            del _saved_digests[digest]
+
+
+def _temp_path(local_path: str, suffix: str) -> str:
+    # A short random name in the target's directory, so the final
+    # os.replace stays on one filesystem and long asset names still fit.
+    # Created with open() rather than mkstemp (0600), so saved files get
+    # the usual umask permissions.
+    directory = os.path.dirname(local_path)
+    while True:
+        temp_path = os.path.join(directory, f".{secrets.token_hex(6)}{suffix}")
+        try:
+            open(temp_path, "xb").close()
+        except FileExistsError:
+            continue
+        return temp_path
+
+
+def _store_response(
+    response: urllib3.BaseHTTPResponse,
+    local_path: str,
+    link_duplicates: bool = True,
+):
+    _ensure_dir(local_path)
+
+    # Write next to the target and move it into place: a failed download
+    # never leaves a truncated file behind, and a path that is a hard link
+    # to another asset is replaced instead of written through.
+    part_path = _temp_path(local_path, ".part")
+    digest = hashlib.blake2b(digest_size=16)
     try:
-        response = safe_request(url)
-        content_type = response.headers.get("Content-Type", "")
-        local_path = sanitize_path(url, base_dir, content_type)
+        with open(part_path, "wb") as f:
+            for chunk in response.stream(CHUNK_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(part_path, local_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    _forget_digest(local_path)
+    if not link_duplicates:
+        return
+
+    key = digest.hexdigest()
+    with _saved_digests_lock:
+        original = _saved_digests.setdefault(key, local_path)
+        if original == local_path:
+            _path_digests[local_path] = key
+
+    if original != local_path:
+        link_path = _temp_path(local_path, ".link")
+        try:
+            os.remove(link_path)
+            os.link(original, link_path)
+            os.replace(link_path, local_path)
+        except OSError:
+            # No hard links here (e.g. FAT, cross-device); keep the copy.
+            if os.path.exists(link_path):
+                os.remove(link_path)
 
-        os.makedirs(os.path.dirname(local_path), exist_ok=True)
 
-        with open(local_path, "wb") as f:
-            f.write(response.read())
+def save_file(url: str, base_dir: str) -> str | None:
+    cached_path = saved_files.get((url, base_dir))
+    if cached_path is not None:
+        return cached_path
+
+    try:
+        response = safe_request(url)
+        try:
+            content_type = response.headers.get("Content-Type", "")
+            local_path = sanitize_path(url, base_dir, content_type)
+            _store_response(response, local_path, not _is_page(local_path, content_type))
+        finally:
+            response.release_conn()
 
+        saved_files[(url, base_dir)] = local_path
         return local_path
 
-    except (HTTPError, URLError):
+    except (HTTPError, OSError):
         return None
 # -----------------------------
 # HTML processing
 # -----------------------------
 
-def extract_assets(soup: BeautifulSoup, base_url: str) -> set[str]:
-    assets = set()
+_REF_XPATH = etree.XPath(
+    "//a[@href] | //link[@href] | //script[@src]"
+    " | //img[@src or @srcset] | //source[@srcset]"
+)
+
+
+_XML_DECLARATION_RE = re.compile(rb"^(?:\xef\xbb\xbf)?\s*<\?xml\b[^>]*\?>")
+_DECLARED_ENCODING_RE = re.compile(rb"""\bencoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+_META_CHARSET_RE = re.compile(rb"""<meta\b[^>]*?\bcharset\s*=\s*["']?\s*[A-Za-z0-9._:-]""", re.IGNORECASE)
+_META_CHARSET_XPATH = etree.XPath(
+    "//meta[@charset]"
+    " | //meta[translate(@http-equiv, 'CONTENT-YP', 'content-yp') = 'content-type']"
+)
+_SRCSET_RE = re.compile(r"\s*([^,\s]+)(?:\s+([^,]+?))?\s*(?:,|$)")
 
-    for tag in soup.find_all(["link", "script", "img"]):
-        attr = "href" if tag.name == "link" else "src"
-        value = tag.get(attr)
-        if not value:
-            continue
-        if isinstance(value, list):
-            value = value[0] if value else ""
-        if value:
-            assets.add(urljoin(base_url, str(value)))
-
-    for tag in soup.find_all(["img", "source"]):
-        srcset_value = tag.get("srcset")
-        if not srcset_value:
-            continue
-        if isinstance(srcset_value, list):
-            srcset_value = " ".join(srcset_value)
-        srcset_value = str(srcset_value)
-        for entry in srcset_value.split(","):
-            url_part = entry.strip().split(" ", 1)[0]
-            if url_part:
-                assets.add(urljoin(base_url, url_part))
-
-    return assets
-
-
-def extract_links(soup: BeautifulSoup, base_url: str) -> set[str]:
-    links = set()
-
-    for a in soup.find_all("a", href=True):
-        href = a.get("href")
-        if isinstance(href, list):
-            href = href[0] if href else ""
-        href = str(href) if href else ""
-        if not href:
-            continue
-        if href.startswith("#"):
-            continue
 
-        full = urljoin(base_url, href)
-        if not full.startswith(("http://", "https://")):
+def _known_encoding(encoding: str) -> str | None:
+    # Canonical codec name, so spellings like latin_1 or u8 reach libxml2
+    # as iso8859-1 / utf-8.
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return None
+
+
+def _decodes_as(body: bytes, encoding: str) -> bool:
+    try:
+        body.decode(encoding)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def _parse_html(body: bytes, encoding: str | None):
+    return lxml.html.document_fromstring(body, parser=lxml.html.HTMLParser(encoding=encoding, default_doctype=False))
+
+
+def _charset(content_type: str) -> str | None:
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset":
+            return _known_encoding(value.strip().strip("\"'"))
+    return None
+
+
+def parse_document(body: bytes, content_type: str, is_xml: bool):
+    if is_xml:
+        try:
+            root = etree.fromstring(body, etree.XMLParser(recover=True, resolve_entities=False))
+        except etree.XMLSyntaxError:
+            root = None
+        if root is not None:
+            return root
+
+    # XHTML may open with an XML declaration, which the HTML parser would
+    # keep as a bogus <!--?xml ...?--> comment. Drop it, but honour the
+    # encoding it declares.
+    declared_encoding = None
+    declaration = _XML_DECLARATION_RE.match(body)
+    if declaration:
+        match = _DECLARED_ENCODING_RE.search(declaration.group(0))
+        if match:
+            declared_encoding = _known_encoding(match.group(1).decode("ascii"))
+        body = body[declaration.end():]
+
+    # Without a charset lxml falls back to latin-1 unless the page has a
+    # <meta charset>; bodies that are valid UTF-8 and declare nothing
+    # themselves are almost always UTF-8. A page that does declare its
+    # charset is left for lxml to sniff.
+    encoding = _charset(content_type) or declared_encoding
+    if encoding is not None and not _decodes_as(body, encoding):
+        # A wrong header charset would silently drop or mangle characters.
+        encoding = None
+    if encoding is None and not _META_CHARSET_RE.search(body) and _decodes_as(body, "utf-8"):
+        encoding = "utf-8"
+
+    try:
+        return _parse_html(body, encoding)
+    except LookupError:
+        # A codec Python has but libxml2 lacks (euc_jp, utf-8-sig, ...):
+        # the body is known to decode, so hand libxml2 UTF-8 instead.
+        assert encoding is not None
+        return _parse_html(body.decode(encoding).encode("utf-8"), "utf-8")
+
+
+def _replace_file(path: str, write: Callable[[str], None]):
+    # Pages go to a temporary file that then replaces the target, like
+    # downloads do, so they are never written through a hard link.
+    part_path = _temp_path(path, ".part")
+    try:
+        write(part_path)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    _forget_digest(path)
+
+
+def _sync_meta_charset(root, encoding: str):
+    # The saved file has no Content-Type header to go with it, so its
+    # <meta> must name the encoding it is actually written in.
+    for meta in _META_CHARSET_XPATH(root):
+        if meta.get("charset") is not None:
+            meta.set("charset", encoding)
+        else:
+            content = meta.get("content") or ""
+            meta.set("content", re.sub(r"(?i)(charset\s*=\s*)[^;\s]*", rf"\g<1>{encoding}", content))
+
+
+def write_document(root, path: str):
+    # libxml2 serializes straight into the file; the page is never built
+    # up as one Python bytes object first.
+    tree = root.getroottree()
+    encoding = tree.docinfo.encoding or "utf-8"
+    if isinstance(root, lxml.html.HtmlElement):
+        _sync_meta_charset(root, encoding)
+        _replace_file(path, lambda part_path: tree.write(part_path, method="html", encoding=encoding))
+    else:
+        _replace_file(path, lambda part_path: tree.write(part_path, encoding=encoding, xml_declaration=True))
+
+
+def write_raw_document(body: bytes, path: str):
+    def write(part_path: str):
+        with open(part_path, "wb") as f:
+            f.write(body)
+
+    _replace_file(path, write)
+
+
+def process_page(
+    root,
+    page_url: str,
+) -> tuple[set[str], set[str], list[tuple]]:
+    # One pass over the tree: collect assets and crawlable links, and
+    # remember which attributes rewrite_links should point at local copies.
+    assets: set[str] = set()
+    links: set[str] = set()
+    rewrites: list[tuple] = []
+
+    for tag in _REF_XPATH(root):
+        name = tag.tag
+        if name == "a":
+            href = tag.get("href")
+            if not href or href.startswith("#"):
+                continue
+
+            full = urljoin(page_url, href)
+            if not full.startswith(("http://", "https://")):
+                continue
+
+            parsed = _parse(full)
+            links.add(parsed._replace(fragment="").geturl())
             continue
 
-        parsed = urlparse(full)
-        clean = parsed._replace(fragment="").geturl()
-        links.add(clean)
+        if name != "source":
+            attr = "href" if name == "link" else "src"
+            value = tag.get(attr)
+            if value:
+                full_url = urljoin(page_url, value)
+                assets.add(full_url)
+                rewrites.append((tag, attr, full_url))
+
+        if name in ("img", "source"):
+            srcset_value = tag.get("srcset")
+            if srcset_value:
+                for match in _SRCSET_RE.finditer(srcset_value):
+                    assets.add(urljoin(page_url, match.group(1)))
+                rewrites.append((tag, "srcset", srcset_value))
 
-    return links
+    return assets, links, rewrites
+
+
+@functools.lru_cache(maxsize=8192)
+def _relpath(path: str, start: str) -> str:
+    return os.path.relpath(path, start)
 
 
 def rewrite_links(
-    soup: BeautifulSoup,
+    rewrites: list[tuple],
     page_url: str,
     base_dir: str,
-    asset_map: dict[str, str] | None = None,
+    asset_map: dict[str, str],
 ):
     page_path = sanitize_path(page_url, base_dir)
     page_dir = os.path.dirname(page_path)
+    page_netloc = _netloc(page_url)
 
-    for tag in soup.find_all(["link", "script", "img"]):
-        attr = "href" if tag.name == "link" else "src"
-        value = tag.get(attr)
-        if not value:
-            continue
-        if isinstance(value, list):
-            value = value[0] if value else ""
-        value = str(value) if value else ""
-        if not value:
+    for tag, attr, value in rewrites:
+        if attr == "srcset":
+            _rewrite_srcset(tag, value, page_url, page_netloc, page_dir, asset_map)
             continue
 
-        full_url = urljoin(page_url, value)
+        full_url = value
 
-        if not is_same_origin(page_url, full_url):
+        if _netloc(full_url) != page_netloc:
             continue
 
-        if asset_map and full_url in asset_map:
-            local_path = asset_map[full_url]
-        else:
-            local_path = sanitize_path(full_url, base_dir)
-
-        if not os.path.exists(local_path):
+        local_path = asset_map.get(full_url)
+        if not local_path:
             continue
 
         try:
-            relative_path = os.path.relpath(local_path, page_dir)
-            tag[attr] = relative_path.replace("\\", "/")
+            relative_path = _relpath(local_path, page_dir)
+            tag.set(attr, relative_path.replace("\\", "/"))
         except ValueError:
-            tag[attr] = "/" + os.path.relpath(local_path, base_dir).replace("\\", "/")
-
-    for tag in soup.find_all(["img", "source"]):
-        srcset_value = tag.get("srcset")
-        if not srcset_value:
-            continue
-        if isinstance(srcset_value, list):
-            srcset_value = " ".join(srcset_value)
-        srcset_value = str(srcset_value)
-
-        rewritten_entries: list[str] = []
-        for entry in srcset_value.split(","):
-            entry = entry.strip()
-            if not entry:
-                continue
-            parts = entry.split(" ", 1)
-            url_part = parts[0]
-            descriptor = parts[1] if len(parts) > 1 else ""
+            tag.set(attr, "/" + os.path.relpath(local_path, base_dir).replace("\\", "/"))
 
-            full_url = urljoin(page_url, url_part)
-            if not is_same_origin(page_url, full_url):
-                rewritten_entries.append(entry)
-                continue
 
-            if asset_map and full_url in asset_map:
-                local_path = asset_map[full_url]
-            else:
-                local_path = sanitize_path(full_url, base_dir)
+def _rewrite_srcset(
+    tag,
+    srcset_value: str,
+    page_url: str,
+    page_netloc: str,
+    page_dir: str,
+    asset_map: dict[str, str],
+):
+    rewritten_entries: list[str] = []
+    for match in _SRCSET_RE.finditer(srcset_value):
+        url_part, descriptor = match.group(1), match.group(2) or ""
+        entry = f"{url_part} {descriptor}".strip()
+
+        full_url = urljoin(page_url, url_part)
+        if _netloc(full_url) != page_netloc:
+            rewritten_entries.append(entry)
+            continue
 
-            if not os.path.exists(local_path):
-                rewritten_entries.append(entry)
-                continue
+        local_path = asset_map.get(full_url)
+        if not local_path:
+            rewritten_entries.append(entry)
+            continue
 
-            relative_path = os.path.relpath(local_path, page_dir).replace("\\", "/")
-            rewritten_entries.append(f"{relative_path} {descriptor}".strip())
+        relative_path = _relpath(local_path, page_dir).replace("\\", "/")
+        rewritten_entries.append(f"{relative_path} {descriptor}".strip())
 
-        if rewritten_entries:
-            tag["srcset"] = ", ".join(rewritten_entries)
+    if rewritten_entries:
+        tag.set("srcset", ", ".join(rewritten_entries))
 
 
 # -----------------------------
 # Crawl + Analyze Engine
 # -----------------------------
 
-def crawl_page(args):
+def crawl_page(args: tuple[str, int, str, str, int, int, bool]) -> list[tuple[str, int]]:
     url, depth, base_url, project_dir, min_depth, max_depth, no_download = args
-    
-    with visited_lock:
-        if url in visited or depth > max_depth:
-            return []
-        visited.add(url)
-    
+
+    if depth > max_depth:
+        return []
+
     try:
         response = safe_request(url)
-        content_type = response.headers.get("Content-Type", "")
-        normalized_type = content_type.split(";", 1)[0].strip().lower()
-
-        is_xml = url.lower().endswith(".xml") or normalized_type in {"application/xml", "text/xml"}
-        is_html = normalized_type in {"text/html", "application/xhtml+xml"}
-
-        if not is_html and not is_xml:
-            local_path = sanitize_path(url, project_dir, content_type)
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            with open(local_path, "wb") as f:
-                f.write(response.read())
-            print(f"[✓] Saved asset: {url}")
-            return []
-
-        html = response.read()
-        if is_xml:
-            try:
-                soup = BeautifulSoup(html, "xml")
-            except FeatureNotFound:
-                soup = BeautifulSoup(html, "html.parser")
+        try:
+            content_type = response.headers.get("Content-Type", "")
+            normalized_type = _media_type(content_type)
+
+            is_xml = url.lower().endswith(".xml") or normalized_type in _XML_TYPES
+            is_html = normalized_type in _HTML_TYPES
+            is_xhtml = normalized_type == "application/xhtml+xml"
+
+            if not is_html and not is_xml:
+                local_path = sanitize_path(url, project_dir, content_type)
+                _store_response(response, local_path)
+                print(f"[✓] Saved asset: {url}")
+                return []
+
+            html = response.read()
+        finally:
+            response.release_conn()
+
+        try:
+            root = parse_document(html, content_type, is_xml)
+        except etree.ParserError:
+            # Empty, whitespace-only or comment-only pages: nothing to
+            # crawl or rewrite, so they are saved exactly as served.
+            root = None
+
+        if root is not None:
+            assets, links, rewrites = process_page(root, url)
         else:
-            soup = BeautifulSoup(html, "html.parser")
+            assets, links, rewrites = set(), set(), []
 
         new_links = []
-        for link in extract_links(soup, url):
+        for link in links:
             if is_same_origin(base_url, link):
                 new_links.append((link, depth + 1))
 
         if min_depth <= depth <= max_depth:
             if not no_download:
-                assets = extract_assets(soup, url)
-                asset_map = {}
-                for asset in assets:
-                    local_path = save_file(asset, project_dir)
-                    if local_path:
-                        asset_map[asset] = local_path
+                asset_list = list(assets)
+                asset_map: dict[str, str] = {}
+                if asset_list:
+                    with ThreadPoolExecutor(max_workers=min(ASSET_WORKERS, len(asset_list))) as executor:
+                        saved_paths = executor.map(lambda asset: save_file(asset, project_dir), asset_list)
+                        for asset, saved_path in zip(asset_list, saved_paths):
+                            if saved_path:
+                                asset_map[asset] = saved_path
 
-                rewrite_links(soup, url, project_dir, asset_map)
+                rewrite_links(rewrites, url, project_dir, asset_map)
 
                 page_path = sanitize_path(url, project_dir)
-                os.makedirs(os.path.dirname(page_path), exist_ok=True)
-                with open(page_path, "w", encoding="utf-8", errors="ignore") as f:
-                    f.write(str(soup))
+                if is_xhtml and isinstance(root, lxml.html.HtmlElement) and page_path.lower().endswith(_XML_PAGE_EXTENSIONS):
+                    # XHTML is parsed and written back as HTML (no XML
+                    # declaration, unclosed void tags), so it must not keep
+                    # an extension browsers open with their XML parser.
+                    page_path = f"{page_path}.html"
+                _ensure_dir(page_path)
+                if root is not None:
+                    write_document(root, page_path)
+                else:
+                    write_raw_document(html, page_path)
 
             print(f"[✓] Analyzed (depth {depth}): {url}")
         else:
@@ -314,35 +647,37 @@ def crawl_page(args):
 
 def crawl_website(base_url: str, min_depth: int, max_depth: int, export_urls: bool = False, no_download: bool = False, threads: int = 1):
     global visited
-    visited = set()
+    # URLs are marked when they are queued rather than when they are
+    # fetched, so a page linked from many others enters the frontier once.
+    visited = {base_url}
+    _created_dirs.clear()
+    saved_files.clear()
+    _saved_digests.clear()
+    _path_digests.clear()
+    enable_dns_cache()
     
     parsed = urlparse(base_url)
     project_dir = parsed.netloc.replace(".", "_")
     os.makedirs(project_dir, exist_ok=True)
 
     queue = deque([(base_url, 0)])
-
-    while queue:
-        batch = []
-        if threads > 1:
-            for _ in range(min(threads, len(queue))):
-                if queue:
-                    batch.append(queue.popleft())
-        else:
-            batch.append(queue.popleft())
-
-        if threads > 1 and len(batch) > 1:
-            with ThreadPoolExecutor(max_workers=len(batch)) as executor:
-                futures = [executor.submit(crawl_page, (url, depth, base_url, project_dir, min_depth, max_depth, no_download)) for url, depth in batch]
-                for future in as_completed(futures):
-                    for link, depth in future.result():
-                        if link not in visited and depth <= max_depth:
-                            queue.append((link, depth))
-        else:
-            for url, depth in batch:
-                results = crawl_page((url, depth, base_url, project_dir, min_depth, max_depth, no_download))
-                for link, d in results:
+    workers = max(1, threads)
+
+    # Keep up to `workers` pages in flight at all times: a new page is
+    # scheduled as soon as any running one finishes, instead of waiting
+    # for a whole batch (and its slowest page) to complete.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: set[Future[list[tuple[str, int]]]] = set()
+        while queue or pending:
+            while queue and len(pending) < workers:
+                url, depth = queue.popleft()
+                pending.add(executor.submit(crawl_page, (url, depth, base_url, project_dir, min_depth, max_depth, no_download)))
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for link, d in future.result():
                     if link not in visited and d <= max_depth:
+                        visited.add(link)
                         queue.append((link, d))
 
     if export_urls: